@@ -28,7 +28,7 @@ To generate the format expected by the `d3.js` script process the data further:
 from wheel import family_tree
 
 with open("data.json", "w") as f:
-    f.write(json.dumps(family_tree(r.objects)))
+    json.dump(family_tree(r.objects), f)
 ```
 """
 
@@ -98,4 +98,4 @@ class Engine:
             Write the `objects` dictionary in JSON format to that path.
         """
         with open(path, "w") as f:
-            f.write(json.dumps(self.objects))
+            json.dump(self.objects, f)
@@ -1,12 +1,23 @@
 """`Redshift` facilities."""
 
+import queue
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from itertools import zip_longest
 
 from redshift_connector import Connection, connect
 from redshift_connector.cursor import Cursor
 from tqdm import tqdm
 
-from ..parsers.common import clean_query, fetch_children, fetch_parents
+from ..parsers.common import (
+    clean_query,
+    fetch_children,
+    fetch_parents,
+    has_parents,
+    index_paths,
+)
 from . import Engine
 
 
@@ -25,10 +36,17 @@ class Redshift(Engine):
         ----------
         config : dict[str, int | str]
             Connection parameters to connect to the `Redshift` database.
-        connections : dict[str, redshift_connector.Connection]
-            Dictionary of connection objects for each database encountered.
+        connections : dict[str, list[redshift_connector.Connection]]
+            Dictionary of connection objects opened for each database encountered.
+        max_connections : int
+            Maximum number of connections to open overall, shared between databases
+            (but at least one per database).
         objects : dict[str, typing.Any]
             Dictionary of objects encountered, indexed by their respective long names.
+        pool_size : int
+            Maximum number of connections to open per database.
+        pools : dict[str, queue.LifoQueue]
+            Dictionary of pools of connections available for each database encountered.
         """
         self.config = {
             "user": connection_kwargs.get("user"),
@@ -38,8 +56,41 @@ class Redshift(Engine):
             "database": connection_kwargs.get("database"),
         }
 
-        self.connections: dict[str, Connection] = {}
+        self.connections: dict[str, list[Connection]] = {}
+        self.max_connections: int = connection_kwargs.get("max_connections", 8)
         self.objects: dict[str, typing.Any] = {}
+        self.pool_size: int = connection_kwargs.get("pool_size", 4)
+        self.pools: dict[str, queue.LifoQueue] = {}
+
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _cursor(self, d: str) -> typing.Iterator[Cursor]:
+        """Check a connection to a database out of its pool and open a cursor on it.
+
+        Connections are opened lazily, only when all those already opened for that
+        database are in use (and the pool is not full yet); otherwise wait for one of
+        them to be handed back. The pool of the database is expected to be set up.
+
+        Parameters
+        ----------
+        d : str
+            Name of the database to connect to.
+
+        Yields
+        ------
+        : redshift_connector.cursor.Cursor
+            Cursor to use to run queries.
+        """
+        connection = self.pools[d].get()
+        try:
+            if connection is None:
+                connection = connect(**{**self.config, "database": d})
+                self.connections.setdefault(d, []).append(connection)
+            with connection.cursor() as cursor:
+                yield cursor
+        finally:
+            self.pools[d].put(connection)
 
     @staticmethod
     def fetch_columns(cursor: Cursor, n: str, s: str, d: str) -> list[dict[str, str]]:
@@ -78,28 +129,146 @@ class Redshift(Engine):
             ordinal_position
         ```
         """
-        q = f"""
+        q = """
         select
             column_name,
             data_type
         from
             pg_catalog.svv_all_columns
         where
-            database_name = '{d}'
-            and schema_name = '{s}'
-            and table_name = '{n}'
+            database_name = %s
+            and schema_name = %s
+            and table_name = %s
         order by
             ordinal_position
         """
 
         try:
-            cursor.execute(q)
+            cursor.execute(q, (d, s, n))
             c = cursor.fetchall()
         except Exception:
             c = []
 
         return [{"name": n, "datatype": t} for n, t in c]
 
+    @staticmethod
+    def fetch_all_columns(cursor: Cursor, d: str) -> dict[str, list[dict[str, str]]]:
+        """List all columns from all objects of a database.
+
+        Parameters
+        ----------
+        cursor : redshift_connector.cursor.Cursor
+            Cursor to use to run the query.
+        d : str
+            Name of the database hosting the objects.
+
+        Returns
+        -------
+        : dict[str, list[dict[str, str]]]
+            Dictionary describing the columns (name, datatypes) of each object, indexed
+            by their respective long names.
+
+        Notes
+        -----
+        Performing the following [example] query:
+        ```sql
+        select
+            schema_name,
+            table_name,
+            column_name,
+            data_type
+        from
+            pg_catalog.svv_all_columns
+        where
+            database_name = 'database'
+        order by
+            schema_name, table_name, ordinal_position
+        ```
+        """
+        q = """
+        select
+            schema_name,
+            table_name,
+            column_name,
+            data_type
+        from
+            pg_catalog.svv_all_columns
+        where
+            database_name = %s
+        order by
+            schema_name, table_name, ordinal_position
+        """
+
+        c: dict[str, list[dict[str, str]]] = {}
+
+        try:
+            cursor.execute(q, (d,))
+            for s, n, k, t in cursor.fetchall():
+                c.setdefault(f"{d}.{s}.{n}", []).append({"name": k, "datatype": t})
+        except Exception:
+            pass
+
+        return c
+
+    @staticmethod
+    def fetch_all_ddls(cursor: Cursor, d: str) -> dict[str, str]:
+        """Fetch the DDL of all views of a database.
+
+        Materialized views are skipped: their definition only refers to the internal
+        table backing them, the actual DDL has to be fetched via `show view`.
+
+        Parameters
+        ----------
+        cursor : redshift_connector.cursor.Cursor
+            Cursor to use to run the query.
+        d : str
+            Name of the database hosting the views.
+
+        Returns
+        -------
+        : dict[str, str]
+            DDL of each view, indexed by their respective long names.
+
+        Notes
+        -----
+        Performing the following query:
+        ```sql
+        select
+            schemaname,
+            viewname,
+            definition
+        from
+            pg_catalog.pg_views
+        where
+            schemaname not in ('information_schema', 'pg_catalog')
+            and position('mv_tbl__' in definition) = 0
+        ```
+        """
+        q = """
+        select
+            schemaname,
+            viewname,
+            definition
+        from
+            pg_catalog.pg_views
+        where
+            schemaname not in ('information_schema', 'pg_catalog')
+            and position('mv_tbl__' in definition) = 0
+        """
+
+        f: dict[str, str] = {}
+
+        try:
+            cursor.execute(q)
+            for s, n, v in cursor.fetchall():
+                if not v.lstrip().lower().startswith("create"):
+                    v = f"CREATE VIEW {s}.{n} AS {v}"
+                f[f"{d}.{s}.{n}"] = v
+        except Exception:
+            pass
+
+        return f
+
     @staticmethod
     def fetch_ddl(cursor: Cursor, n: str, s: str, d: str, t: str) -> str:
         """Fetch the DDL of an object.
@@ -139,49 +308,137 @@ class Redshift(Engine):
     def fetch(self):
         """List all objects in all databases and fetch all information for each."""
         # fetching the list of all objects does not require a particular database
-        with connect(**self.config) as connection:
+        connection = connect(**self.config)
+        self.connections[self.config["database"]] = [connection]
+
+        # whatever happens, do not leave any connection behind
+        try:
             with connection.cursor() as cursor:
                 self.fetch_objects(cursor)
 
-        # fetching the list of all stored procedures *does* require a particular
-        # database the next few lines clobber existing objects in the database
-        for d in self.connections:
-            with self.connections[d].cursor() as cursor:
-                self.fetch_procs(cursor, d)
-
-        self.objects = dict(sorted(self.objects.items()))
-        paths = list(self.objects.keys())
-
-        # loop over each object and fetch its ddl and columns details, and extract
-        # parents and children from the former
-        for i, o in enumerate(tqdm(self.objects, desc="Fetch object details")):
-            n = self.objects[o]["name"]
-            s = self.objects[o]["schema"]
-            d = self.objects[o]["database"]
-            t = self.objects[o]["type"]
-
-            with self.connections[d].cursor() as cursor:
-                f = self.fetch_ddl(cursor, n, s, d, t)
-                q = clean_query(f)  # clean the query
+            databases = sorted({o["database"] for o in self.objects.values()})
+
+            # share the connections allowed between databases, at least one each
+            share = self.max_connections // max(len(databases), 1)
+            size = max(min(self.pool_size, share), 1)
+            for d in databases:
+                self.pools[d] = queue.LifoQueue()
+                for _ in range(size):
+                    self.pools[d].put(None)  # free slot
+
+            # the connection used to list objects takes a slot of its own database
+            if (d := self.config["database"]) in self.pools:
+                self.pools[d].get()
+                self.pools[d].put(connection)
+            else:
+                self.connections.pop(d)
+                connection.close()
+
+            workers = max(size * len(databases), 1)
+
+            # fetching the list of all stored procedures *does* require a particular
+            # database the next few lines clobber existing objects in the database; one
+            # query per database, independent of each other hence run concurrently
+            def procs(d: str):
+                with self._cursor(d) as cursor:
+                    self.fetch_procs(cursor, d)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(procs, databases))
+
+            paths = sorted(self.objects)
+
+            # columns of all objects, and ddls of all (non-materialized) views, of a
+            # database come in a single query each
+            columns: dict[str, list[dict[str, str]]] = {}
+            for d in databases:
+                with self._cursor(d) as cursor:
+                    columns.update(self.fetch_all_columns(cursor, d))
+                    for o, f in self.fetch_all_ddls(cursor, d).items():
+                        if o in self.objects:
+                            self.objects[o]["ddl"] = f
+
+            # fetching ddls is all waiting on the network: spread objects over the pool
+            # of connections of their database (connections are not shared between
+            # threads)
+            def worker(o: str) -> tuple[str, str]:
+                v = self.objects[o]
+                n, s, d, t = v["name"], v["schema"], v["database"], v["type"]
+
+                with self._cursor(d) as cursor:
+                    return o, self.fetch_ddl(cursor, n, s, d, t)
+
+            # procedures and views come with their ddl already; objects of all databases
+            # are interleaved for all pools to be put to work at once
+            todo: dict[str, list[str]] = {}
+            for o in paths:
+                if not self.objects[o].get("ddl"):
+                    todo.setdefault(self.objects[o]["database"], []).append(o)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(worker, o)
+                    for batch in zip_longest(*todo.values())
+                    for o in batch
+                    if o is not None
+                ]
+                for future in tqdm(
+                    as_completed(futures),
+                    desc="Fetch object details",
+                    total=len(futures),
+                ):
+                    o, f = future.result()
+                    self.objects[o]["ddl"] = f
+
+        finally:
+            # no more queries from here on, close all created connections
+            for connections in self.connections.values():
+                for connection in connections:
+                    connection.close()
+
+            self.connections.clear()
+            self.pools.clear()
+
+        # extract parents and children from the ddl, cpu-bound hence not threaded;
+        # identical ddls (placeholder of those that could not be fetched, procedures
+        # sharing the same body, ...) lead to identical lineage, extracted only once
+        index = index_paths(paths)
+        lineage: dict[tuple[str, str, str], tuple[list, list]] = {}
+        for o in paths:
+            v = self.objects[o]
+            d, t = v["database"], v["type"]
+
+            # only procedures have children, and only ddls referring to other objects
+            # have parents: plain tables and placeholders are not worth parsing
+            if t != "PROCEDURE" and not has_parents(v["ddl"]):
+                v.update({"columns": columns.get(o, []), "parents": [], "children": []})
+                continue
+
+            q = clean_query(v["ddl"])  # clean the query
+
+            if (q, d, t) not in lineage:
 
                 # parent details
-                p = fetch_parents(q, paths, d)
+                p = fetch_parents(q, index, d)
 
-                # column details
+                # children details
                 if t == "PROCEDURE":
-                    c = []
-                    k = fetch_children(q, paths, d)
+                    k = fetch_children(q, index, d)
                 else:
-                    c = self.fetch_columns(cursor, n, s, d)
                     k = []
 
-                self.objects[o].update(
-                    {"ddl": f, "columns": c, "parents": p, "children": k}
-                )
+                lineage[(q, d, t)] = (p, k)
 
-        # close all created connections
-        for connection in self.connections.values():
-            connection.close()
+            p, k = lineage[(q, d, t)]
+
+            # copies, for objects sharing the same lineage not to share the same lists
+            v.update(
+                {
+                    "columns": columns.get(o, []),
+                    "parents": [dict(x) for x in p],
+                    "children": [dict(x) for x in k],
+                }
+            )
 
     def fetch_objects(self, cursor: Cursor):
         """List all objects in all `Redshift` databases.
@@ -228,12 +485,6 @@ class Redshift(Engine):
 
         for d, s, n, t in cursor.fetchall():
 
-            # create a new connection associated with that database
-            if d not in self.connections:
-                config = self.config.copy()
-                config.update({"database": d})
-                self.connections[d] = connect(**config)
-
             # save the object
             self.objects[f"{d}.{s}.{n}"] = {
                 "name": n,
@@ -245,6 +496,12 @@ class Redshift(Engine):
     def fetch_procs(self, cursor: Cursor, d: str):
         """List all stored procedures in all schemas of a `Redshift` database.
 
+        The source of each procedure is fetched in the same query, sparing the
+        per-object `show procedure` round-trip later on. `pg_proc` only holds the body
+        of the procedure, wrapped back into a `CREATE OR REPLACE PROCEDURE` statement.
+        This only goes for stored procedures (written in `plpgsql`): the ddl of other
+        functions (`sql` or `plpythonu` user-defined functions) is left to fetch later.
+
         Parameters
         ----------
         cursor : redshift_connector.cursor.Cursor
@@ -260,13 +517,20 @@ class Redshift(Engine):
             'database' as database_name,
             n.nspname as schema_name,
             p.proname as object_name,
-            'PROCEDURE' as object_type
+            'PROCEDURE' as object_type,
+            oidvectortypes(p.proargtypes) as object_args,
+            p.prosrc as object_ddl,
+            l.lanname as object_language
         from
             pg_catalog.pg_namespace n
         join
             pg_catalog.pg_proc p
         on
             pronamespace = n.oid
+        join
+            pg_catalog.pg_language l
+        on
+            prolang = l.oid
         where
             proowner = current_user_id
             and proname <> 'get_result_set'
@@ -278,13 +542,20 @@ class Redshift(Engine):
             '{d}' as database_name,
             n.nspname as schema_name,
             p.proname as object_name,
-            'PROCEDURE' as object_type
+            'PROCEDURE' as object_type,
+            oidvectortypes(p.proargtypes) as object_args,
+            p.prosrc as object_ddl,
+            l.lanname as object_language
         from
             pg_catalog.pg_namespace n
         join
             pg_catalog.pg_proc p
         on
             pronamespace = n.oid
+        join
+            pg_catalog.pg_language l
+        on
+            prolang = l.oid
         where
             proowner = current_user_id
             and proname <> 'get_result_set'
@@ -292,12 +563,17 @@ class Redshift(Engine):
 
         cursor.execute(q)
 
-        for d, s, n, t in cursor.fetchall():
+        for d, s, n, t, a, f, lang in cursor.fetchall():
+            o = {"name": n, "schema": s, "database": d, "type": t}
 
-            # store the proc
-            self.objects[f"{d}.{s}.{n}"] = {
-                "name": n,
-                "schema": s,
-                "database": d,
-                "type": t,
-            }
+            # only stored procedures can be rebuilt from their body
+            if lang == "plpgsql":
+                o["ddl"] = (
+                    f"CREATE OR REPLACE PROCEDURE {s}.{n}({a})\n"
+                    " LANGUAGE plpgsql\n"
+                    f"AS $$\n{f}\n$$"
+                )
+
+            # store the proc, procedures of several databases might be fetched at once
+            with self._lock:
+                self.objects[f"{d}.{s}.{n}"] = o
@@ -1,19 +1,136 @@
 """Common tools, parsers and helpers."""
 
 import re
+from functools import lru_cache
+from operator import itemgetter
 
-from sqlparse import format as sqlformat
+# keywords the patterns below rely on, uppercased whatever their original case
+_KEYWORDS = frozenset(
+    (
+        "ALTER",
+        "CREATE",
+        "EXISTS",
+        "FROM",
+        "IF",
+        "INSERT",
+        "INTO",
+        "JOIN",
+        "LOCATION",
+        "MATERIALIZED",
+        "NOT",
+        "REFRESH",
+        "SELECT",
+        "TABLE",
+        "UPDATE",
+        "VIEW",
+    )
+)
 
+# quoted strings/identifiers (left untouched, quotes escaped either by doubling or by a
+# backslash), comments, and words not following a dot
+_RE_TOKENS = re.compile(
+    r"('(?:[^'\\]|''|\\.)*'|\"(?:[^\"\\]|\"\"|\\.)*\")"
+    r"|(/\*.*?\*/|--[^\n]*)"
+    r"|(?<![\w.$])([A-Za-z_][\w$]*)",
+    re.DOTALL,
+)
 
-def _match(name: str, paths: list[str], database: str) -> str:
+# dotted identifiers, and equal/concatenation/cast operators
+_RE_CLEAN = re.compile(
+    r"([A-Za-z0-9_]+)\s*\.\s*(?=[A-Za-z0-9_])"
+    r"|\s*(?<![<>!])(=)\s*"
+    r"|\s*(\|\||::)\s*",
+    re.DOTALL,
+)
+
+_PUNCT = str.maketrans({"(": " ( ", ",": " , ", ")": " ) "})
+
+_RE_CHILDREN = re.compile(
+    r"(?:"
+    # alter materialized view or table
+    r"ALTER\s+MATERIALIZED\s+VIEW"
+    r"|ALTER\s+TABLE"
+    # create materialized view, table or view
+    r"|CREATE\s+[A-Za-z]*\s+MATERIALIZED\s+VIEW"
+    r"|CREATE\s+[A-Za-z]*\s+TABLE\s+IF\s+NOT\s+EXISTS"
+    r"|CREATE\s+[A-Za-z]*\s+TABLE"
+    r"|CREATE\s+[A-Za-z]*\s+VIEW"
+    # insert into
+    r"|INSERT\s+INTO"
+    # refresh
+    r"|REFRESH\s+MATERIALIZED\s+VIEW"
+    # select into, within a single statement; no support for extra keywords!
+    r"|SELECT\s+[^;]*?\s+INTO"
+    # update
+    r"|UPDATE"
+    r")\s+([^(].*?)\s"
+)
+
+_RE_PARENTS = re.compile(
+    r"FROM\s+([^(].*?)[(\s;)]" r"|JOIN\s+([^(].*?)[(\s)]" r"|LOCATION\s+'([^']*)'"
+)
+
+# keywords introducing the alternatives above, to keep in sync with the latter
+_RE_REFERENCES = re.compile(r"FROM|JOIN|LOCATION", re.IGNORECASE)
+
+
+def _clean(m: re.Match) -> str:
+    """Return the replacement of a match of the query cleaning pattern.
+
+    Parameters
+    ----------
+    m : re.Match
+        Match of the `_RE_CLEAN` pattern.
+
+    Returns
+    -------
+    : str
+        Replacement string.
+    """
+    # dotted identifier
+    if m.group(1):
+        return f"{m.group(1)}."
+
+    # operators
+    if (op := m.group(2) or m.group(3)) == "::":
+        return "::"
+
+    return f" {op} "
+
+
+def _format(m: re.Match) -> str:
+    """Return the replacement of a match of the query tokenizing pattern.
+
+    Parameters
+    ----------
+    m : re.Match
+        Match of the `_RE_TOKENS` pattern.
+
+    Returns
+    -------
+    : str
+        Replacement string.
+    """
+    # comment
+    if m.group(2):
+        return " "
+
+    # keyword
+    if m.group(3) and (w := m.group(3).upper()) in _KEYWORDS:
+        return w
+
+    return m.group(0)
+
+
+def _match(name: str, index: dict[tuple[str, str], str], database: str) -> str:
     """Match a short name to the most probable object.
 
     Parameters
     ----------
     name : str
         The short name to consider.
-    paths : list[str]
-        List of object full paths.
+    index : dict[tuple[str, str], str]
+        Index of object full paths, as returned by `index_paths()`.
     database : str
         Limit the matching to a specific database.
 
@@ -22,19 +139,16 @@ def _match(name: str, paths: list[str], database: str) -> str:
     : str
         Most probable object long name associated with a short name.
     """
-    for p in paths:
-
-        # database.schema.object
-        if name.count(".") == 2 and p == name:
-            return p
-
-        # schema.object or object
-        if p.startswith(f"{database}.") and p.endswith(name):
-            return p
+    # database.schema.object
+    if name.count(".") == 2:
+        d, _, n = name.partition(".")
+        return index.get((d, n), "")
 
-    return ""
+    # schema.object or object
+    return index.get((database, name), "")
 
 
+@lru_cache(maxsize=4096)
 def clean_query(query: str) -> str:
     """Deep-cleaning of a SQL query.
 
@@ -48,31 +162,28 @@ def clean_query(query: str) -> str:
     : str
         Cleaned up query.
     """
-    # good effort, but does not know some functions/keywords
-    q = sqlformat(query, keyword_case="upper", strip_comments=True)
+    # strip comments and uppercase keywords, leaving quoted strings untouched
+    q = _RE_TOKENS.sub(_format, query)
 
     # regular cleaning
-    q = re.sub(r"/\*.*\*/", "", q, flags=re.DOTALL)
-    q = re.sub(r"--.*", "", q)
-    q = re.sub("([(,)])", r" \1 ", q)
-    q = re.sub(r"([A-Za-z0-9_]+)\s*\.\s*([A-Za-z0-9_]+)", r"\1.\2", q)
-    q = re.sub(r"(.*)\s*=\s*(.*)", r"\1 = \2", q)
-    q = re.sub(r"(.*)\s*\|\|\s*(.*)", r"\1 || \2", q)
-    q = re.sub(r"(.*)\s*::\s*(.*)", r"\1::\2", q)
-    q = re.sub(r"[\s]+", " ", q).strip()
+    q = _RE_CLEAN.sub(_clean, q)
+    q = q.translate(_PUNCT)
+    q = " ".join(q.split())
 
     return q
 
 
-def fetch_children(query: str, paths: list[str], database: str) -> list[dict[str, str]]:
+def fetch_children(
+    query: str, index: dict[tuple[str, str], str], database: str
+) -> list[dict[str, str]]:
     r"""Extract objects from various SQL statements. Skip temporary ones.
 
     Parameters
     ----------
     query : str
         The DDL to parse.
-    paths : list[str]
-        List of object full paths.
+    index : dict[tuple[str, str], str]
+        Index of object full paths, as returned by `index_paths()`.
     database : str
         Limit the matching to a specific database.
 
@@ -83,63 +194,40 @@ def fetch_children(query: str, paths: list[str], database: str) -> list[dict[str
 
     Notes
     -----
-    Regexes:
-    * `ALTER\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s`
-    * `ALTER\s+TABLE\s+([^(].*?)\s`
-    * `CREATE\s+[A-Za-z]*\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s`
-    * `CREATE\s+[A-Za-z]*\s+TABLE\s+IF\s+NOT\s+EXISTS\s+([^(].*?)\s`
-    * `CREATE\s+[A-Za-z]*\s+TABLE\s+([^(].*?)\s`
-    * `CREATE\s+[A-Za-z]*\s+VIEW\s+([^(].*?)\s`
-    * `INSERT\s+INTO\s+([^(].*?)\s`
-    * `REFRESH\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s`
-    * `SELECT\s+.*\s+INTO\s+([^(].*?)\s`
-    * `UPDATE\s+([^(].*?)\s`
+    Alternatives of the (single) regex, followed by `\s+([^(].*?)\s`:
+    * `ALTER\s+MATERIALIZED\s+VIEW`
+    * `ALTER\s+TABLE`
+    * `CREATE\s+[A-Za-z]*\s+MATERIALIZED\s+VIEW`
+    * `CREATE\s+[A-Za-z]*\s+TABLE\s+IF\s+NOT\s+EXISTS`
+    * `CREATE\s+[A-Za-z]*\s+TABLE`
+    * `CREATE\s+[A-Za-z]*\s+VIEW`
+    * `INSERT\s+INTO`
+    * `REFRESH\s+MATERIALIZED\s+VIEW`
+    * `SELECT\s+[^;]*?\s+INTO`
+    * `UPDATE`
     """
-    l: list[str] = []
+    seen: set[str] = set()
     k: list[dict[str, str]] = []  # kids
 
-    for r in (
-        # alter materialized view or table
-        r"ALTER\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s",
-        r"ALTER\s+TABLE\s+([^(].*?)\s",
-        # create materialized view, table or view
-        r"CREATE\s+[A-Za-z]*\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s",
-        r"CREATE\s+[A-Za-z]*\s+TABLE\s+IF\s+NOT\s+EXISTS\s+([^(].*?)\s",
-        r"CREATE\s+[A-Za-z]*\s+TABLE\s+([^(].*?)\s",
-        r"CREATE\s+[A-Za-z]*\s+VIEW\s+([^(].*?)\s",
-        # insert into
-        r"INSERT\s+INTO\s+([^(].*?)\s",
-        # refresh
-        r"REFRESH\s+MATERIALIZED\s+VIEW\s+([^(].*?)\s",
-        # select into; no support for extra keywords!
-        r"SELECT\s+.*\s+INTO\s+([^(].*?)\s",
-        # update
-        r"UPDATE\s+([^(].*?)\s",
-    ):
-
-        # some keywords are not recognized by sqlparse and not uppercased
-        if "materialized" in r.lower():
-            f = re.IGNORECASE
-        else:
-            f = 0  # type: ignore
-
-        for m in re.finditer(r, query, flags=f):
-            if (o := m.group(1)) not in l:
-                k.append({"name": o, "path": f".{_match(o, paths, database)}"})
-                l.append(o)  # bookkeeping
-
-    return sorted(k, key=lambda o: o["name"])
-
-
-def fetch_parents(query: str, paths: list[str], database: str) -> list[dict[str, str]]:
+    for m in _RE_CHILDREN.finditer(query):
+        if (o := m.group(1)) not in seen:
+            k.append({"name": o, "path": f".{_match(o, index, database)}"})
+            seen.add(o)  # bookkeeping
+
+    return sorted(k, key=itemgetter("name"))
+
+
+def fetch_parents(
+    query: str, index: dict[tuple[str, str], str], database: str
+) -> list[dict[str, str]]:
     r"""Extract objects from `FROM`/`JOIN`/`LOCATION` statements. Skip temporary ones.
 
     Parameters
     ----------
     query : str
         The DDL to parse.
-    paths : list[str]
-        List of object full paths.
+    index : dict[tuple[str, str], str]
+        Index of object full paths, as returned by `index_paths()`.
     database : str
         Limit the matching to a specific database.
 
@@ -151,22 +239,63 @@ def fetch_parents(query: str, paths: list[str], database: str) -> list[dict[str,
 
     Notes
     -----
-    Regexes:
+    Alternatives of the (single) regex:
     * `FROM\s+([^(].*?)[(\s;)]`
     * `JOIN\s+([^(].*?)[(\s)]`
-    * `LOCATION\s+'(.*)'`
+    * `LOCATION\s+'([^']*)'`
     """
-    l: list[str] = []
+    seen: set[str] = set()
     p: list[dict[str, str]] = []  # parents
 
-    for r in (
-        r"FROM\s+([^(].*?)[(\s;)]",
-        r"JOIN\s+([^(].*?)[(\s)]",
-        r"LOCATION\s+'(.*)'",
-    ):
-        for m in re.finditer(r, query):
-            if (o := m.group(1)) not in l:
-                p.append({"name": o, "path": f".{_match(o, paths, database)}"})
-                l.append(o)  # bookkeeping
-
-    return sorted(p, key=lambda o: o["name"])
+    for m in _RE_PARENTS.finditer(query):
+        if (o := m.group(1) or m.group(2) or m.group(3)) not in seen:
+            p.append({"name": o, "path": f".{_match(o, index, database)}"})
+            seen.add(o)  # bookkeeping
+
+    return sorted(p, key=itemgetter("name"))
+
+
+def has_parents(query: str) -> bool:
+    """Tell whether a SQL query might refer to parent objects.
+
+    Cheap check on the raw query (no cleaning needed): without any of the keywords
+    `fetch_parents()` relies on, whatever their case, there is no parent to find.
+
+    Parameters
+    ----------
+    query : str
+        The DDL to check.
+
+    Returns
+    -------
+    : bool
+        Whether the query is worth parsing for parents.
+    """
+    return _RE_REFERENCES.search(query) is not None
+
+
+def index_paths(paths: list[str]) -> dict[tuple[str, str], str]:
+    """Index object full paths by database and short names.
+
+    Each `database.schema.object` path is indexed under both its
+    `(database, "schema.object")` and `(database, "object")` keys. If several objects
+    share a short name, the first one in the given order wins.
+
+    Parameters
+    ----------
+    paths : list[str]
+        List of object full paths.
+
+    Returns
+    -------
+    : dict[tuple[str, str], str]
+        Object full paths indexed by database and short names.
+    """
+    index: dict[tuple[str, str], str] = {}
+
+    for p in paths:
+        d, _, n = p.partition(".")
+        index.setdefault((d, n), p)
+        index.setdefault((d, n.partition(".")[2]), p)
+
+    return index
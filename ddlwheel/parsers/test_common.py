@@ -0,0 +1,107 @@
+"""Regression tests of the query cleaning and lineage extraction."""
+
+import pytest
+
+from .common import clean_query, fetch_children, fetch_parents, index_paths
+
+INDEX = index_paths(["db.s.t1", "db.s.t2", "db.s.t3"])
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        # quotes escaped by a backslash
+        (
+            r"create view s.v as select 'a\'b' as x from s.t1 where y = 'c';",
+            r"CREATE VIEW s.v as SELECT 'a\'b' as x FROM s.t1 where y = 'c';",
+        ),
+        # quotes escaped by doubling
+        (
+            "create view s.v as select 'it''s' as x from s.t1;",
+            "CREATE VIEW s.v as SELECT 'it''s' as x FROM s.t1;",
+        ),
+        # comments, containing quotes
+        (
+            "select 1 -- it's a comment\nfrom s.t1 /* don't */ join s.t2 on a=b;",
+            "SELECT 1 FROM s.t1 JOIN s.t2 on a = b;",
+        ),
+        # comparison (left as is), equal, concatenation and cast operators
+        (
+            "select a>=1, b != 2, c<=3, d=4, e||'x', f :: int from s.t1;",
+            "SELECT a>=1 , b != 2 , c<=3 , d = 4 , e || 'x' , f::int FROM s.t1;",
+        ),
+        # dotted chains
+        (
+            "select * from db . s . t1 join s .t2 using (id);",
+            "SELECT * FROM db.s.t1 JOIN s.t2 using ( id ) ;",
+        ),
+        # keywords within strings, identifiers named after keywords
+        (
+            "select 'from s.t9' as x from data;",
+            "SELECT 'from s.t9' as x FROM data;",
+        ),
+    ],
+)
+def test_clean_query(query: str, expected: str):
+    """Test the cleaning of various queries."""
+    assert clean_query(query) == expected
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        # quotes escaped by a backslash
+        (
+            r"create view s.v as select 'a\'b' as x from s.t1 where y = 'c';",
+            ["s.t1"],
+        ),
+        # comments, containing quotes
+        (
+            "select 1 -- it's a comment\nfrom s.t1 /* don't */ join s.t2 on a=b;",
+            ["s.t1", "s.t2"],
+        ),
+        # dotted chains
+        ("select * from db . s . t1 join s .t2 using (id);", ["db.s.t1", "s.t2"]),
+        # keywords within strings
+        ("select 'from s.t9' as x from s.t1;", ["s.t1"]),
+        # s3 location, followed by other strings
+        (
+            "create external table s.e (a int) location 's3://bkt/p/' "
+            "table properties ('numRows'='10')",
+            ["s3://bkt/p/"],
+        ),
+    ],
+)
+def test_fetch_parents(query: str, expected: list[str]):
+    """Test the extraction of parents from various queries."""
+    assert [p["name"] for p in fetch_parents(clean_query(query), INDEX, "db")] == (
+        expected
+    )
+
+
+def test_fetch_parents_paths():
+    """Test the matching of parents to the objects of the database."""
+    q = clean_query("select * from s.t1 join t2 using (id) join s3 using (id);")
+
+    assert fetch_parents(q, INDEX, "db") == [
+        {"name": "s.t1", "path": ".db.s.t1"},
+        {"name": "s3", "path": "."},
+        {"name": "t2", "path": ".db.s.t2"},
+    ]
+
+
+def test_fetch_children():
+    """Test the extraction of children from a procedure body."""
+    q = clean_query(
+        "begin\n"
+        "  create temp table tmp as select * from s.t1;\n"
+        "  insert into s.t2 (select * from tmp);\n"
+        "  update s.t3 set a = 1;\n"
+        "end;"
+    )
+
+    assert fetch_children(q, INDEX, "db") == [
+        {"name": "s.t2", "path": ".db.s.t2"},
+        {"name": "s.t3", "path": ".db.s.t3"},
+        {"name": "tmp", "path": "."},
+    ]
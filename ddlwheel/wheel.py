@@ -2,6 +2,14 @@
 
 import re
 import typing
+from collections import defaultdict
+from itertools import chain
+
+# object types renamed for visualization
+_TYPES = {"PROCEDURE": "STORED PROCEDURE"}
+
+# materialized views are listed as views
+_RE_MATVIEW = re.compile(r"create\s+materialized\s+view", re.IGNORECASE)
 
 
 def _cname(path: str, name: str) -> str:
@@ -21,8 +29,9 @@ def _cname(path: str, name: str) -> str:
     """
     # s3, or temporary objects (latter ignored)
     if path == ".":
-        if name.startswith("s3"):
-            return ".".join(re.sub("s3.*://", "s3/", name).split("/")[:3])
+        scheme, sep, location = name.partition("://")
+        if sep and scheme in ("s3", "s3a", "s3n"):
+            return ".".join(["s3", *location.split("/", 2)[:2]])
 
     # database object
     else:
@@ -46,40 +55,35 @@ def family_tree(objects: dict[str, typing.Any]) -> list[dict[str, list[str] | st
     """
     tree: list[dict[str, list[str] | str]] = []
 
-    incoming: dict[str, list[str]] = {o: [] for o in objects.keys()}
-    outgoing: dict[str, list[str]] = {o: [] for o in objects.keys()}
+    incoming: defaultdict[str, set[str]] = defaultdict(set)
+    outgoing: defaultdict[str, set[str]] = defaultdict(set)
 
     external: list[str] = []
 
-    for oi in objects.keys():
+    for oi, v in objects.items():
 
         # parents
-        for p in objects[oi]["parents"]:
+        for p in v["parents"]:
             if (oj := _cname(p["path"], p["name"])) != "":
-                incoming[oi].append(oj)
-
-                try:
-                    outgoing[oj].append(oi)
-                except KeyError:
-                    outgoing[oj] = [oi]
 
-                    # fix for objects *outside* the database itself
-                    incoming[oj] = []
+                # fix for objects *outside* the database itself
+                if oj not in objects and oj not in outgoing:
                     external.append(oj)
 
+                incoming[oi].add(oj)
+                outgoing[oj].add(oi)
+
         # children
-        for k in objects[oi]["children"]:
+        for k in v["children"]:
             if (oj := _cname(k["path"], k["name"])) != "":
-                outgoing[oi].append(oj)
-
-                try:
-                    incoming[oj].append(oi)
-                except KeyError:
-                    incoming[oj] = [oi]
+                outgoing[oi].add(oj)
+                incoming[oj].add(oi)
 
-    for o in list(objects.keys()) + external:
-        d = objects.get(o, {}).get("database", "s3")
-        s = objects.get(o, {}).get("schema", "s3")
+    # emit objects in case-insensitive order of their names, no need to sort the tree
+    for o in sorted(chain(objects, external), key=str.lower):
+        v = objects.get(o, {})
+        d = v.get("database", "s3")
+        s = v.get("schema", "s3")
 
         # rework of some object path and type for visualization
         if d == "s3":
@@ -88,12 +92,8 @@ def family_tree(objects: dict[str, typing.Any]) -> list[dict[str, list[str] | st
             s = o.split(".")[1]
             t = "BUCKET"
         else:
-            t = objects[o]["type"]
-            if t == "PROCEDURE":
-                t = "STORED PROCEDURE"
-            if t == "VIEW" and re.match(
-                r"create\s+materialized\s+view", objects[o]["ddl"].lower()
-            ):
+            t = _TYPES.get(v["type"], v["type"])
+            if t == "VIEW" and _RE_MATVIEW.match(v["ddl"]):
                 t = "MATERIALIZED VIEW"
 
         tree.append(
@@ -101,10 +101,10 @@ def family_tree(objects: dict[str, typing.Any]) -> list[dict[str, list[str] | st
                 "database": d,
                 "schema": s,
                 "name": o,
-                "incoming": [i for i in incoming[o]],
-                "outgoing": [o for o in outgoing[o]],
+                "incoming": sorted(incoming[o]),
+                "outgoing": sorted(outgoing[o]),
                 "type": t,
             }
         )
 
-    return sorted(tree, key=lambda o: o["name"].lower())  # type: ignore
+    return tree
@@ -5,7 +5,7 @@ import setuptools  # type: ignore
 setuptools.setup(
     author="carnarez",
     description="Query and parse SQL DDL, and extract lineage.",
-    install_requires=["sqlparse", "tqdm"],
+    install_requires=["tqdm"],
     name="ddlwheel",
     packages=setuptools.find_packages(),
     package_data={"ddlwheel": ["py.typed"]},